@@ -1,12 +1,22 @@
 """This file contains the class handling the canvas (single frame) creation."""
 
 import cairo
+import numpy as np
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from math import sqrt
 
 from table import Table
 from square import Square
-from utils import get_color, interpolate_temperature, rescale
+from utils import (
+    blend_colors,
+    compute_pixels,
+    create_lut,
+    get_colors,
+    lut_indices,
+    rescale,
+    write_bmp,
+)
 
 
 class Canvas:
@@ -35,20 +45,46 @@ class Canvas:
         self._background_color = (0.96, 0.96, 0.96)
         self._text_color = (0.2, 0.2, 0.2)
         self._title_color = (0.05, 0.05, 0.05)
+        self._background_pixel = blend_colors(
+            np.array((*self._background_color, 1)), self._background_color
+        )
 
         self._title_font_size = self._title_size * 0.35
         self._subtitle_font_size = self._title_size * 0.2
         self._text_font_size = self._title_size * 0.13
 
+        self._title = "average Earth temperature, year by year"
+        self._subtitle = "the temperature anomalies are evaluated with respect to the mean of all records"
+
+        # font faces and color sources, created only once
+        self._font_faces = {
+            weight: cairo.ToyFontFace("Gilroy", cairo.FONT_SLANT_NORMAL, weight)
+            for weight in (cairo.FONT_WEIGHT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+        }
+        self._text_source = cairo.SolidPattern(*self._text_color)
+        self._title_source = cairo.SolidPattern(*self._title_color)
+
+        # current font status, saved along with the canvas status
+        self._font_weight = None
+        self._font_size = None
+        self._font_stack = []
+        # text extents, cached by font weight, font size and text
+        self._extents_cache = {}
+
         # load table
         self._table = Table("dataset/1880-2022.csv")
 
+        # create the pixel buffer, shared with the canvas
+        # each ARGB32 pixel is a native endian 32 bit integer
+        self._pixels = np.zeros((self._height, self._width), dtype=np.uint32)
         # create canvas
-        self._canvas = cairo.ImageSurface(
-            cairo.FORMAT_ARGB32, self._width, self._height
+        self._canvas = cairo.ImageSurface.create_for_data(
+            self._pixels, cairo.FORMAT_ARGB32, self._width, self._height
         )
         # create drawing context
         self._ctx = cairo.Context(self._canvas)
+        # threads writing the images to file
+        self._save_pool = ThreadPoolExecutor(max_workers=2)
 
     def _createLabels(self) -> None:
         """Create labels for all the texts in the frames."""
@@ -61,12 +97,13 @@ class Canvas:
         ]
 
     def _clearCanvas(self) -> None:
-        """Clear and scales the drawing area."""
-        # clears background
-        self._ctx.rectangle(0, 0, self._width, self._height)
-        self._ctx.set_source_rgb(*self._background_color)
-        self._ctx.fill()
-        # scale drawing to accomodate border
+        """Clear the drawing area."""
+        self._canvas.flush()
+        self._pixels.fill(self._background_pixel)
+        self._canvas.mark_dirty()
+
+    def _scaleCanvas(self) -> None:
+        """Scale the drawing area to accomodate the border."""
         self._ctx.translate(self._title_size / 2, self._title_size)
         self._ctx.translate(self._width / 2, self._height / 2)
         self._ctx.scale(1 - self._border, 1 - self._border)
@@ -75,10 +112,45 @@ class Canvas:
     def _saveCanvas(self) -> None:
         """Save canvas status."""
         self._ctx.save()
+        self._font_stack.append((self._font_weight, self._font_size))
 
     def _restoreCanvas(self) -> None:
         """Restore canvas status."""
         self._ctx.restore()
+        self._font_weight, self._font_size = self._font_stack.pop()
+
+    def _selectFont(self, weight: cairo.FontWeight) -> None:
+        """Select the font used to write text.
+
+        Args:
+            weight (cairo.FontWeight): weight of the font
+        """
+        self._ctx.set_font_face(self._font_faces[weight])
+        self._font_weight = weight
+
+    def _setFontSize(self, size: float) -> None:
+        """Set the size of the font used to write text.
+
+        Args:
+            size (float): size of the font
+        """
+        self._ctx.set_font_size(size)
+        self._font_size = size
+
+    def _textExtents(self, text: str) -> cairo.TextExtents:
+        """Get the extents of a text with the current font, caching the result.
+
+        Args:
+            text (str): text to be measured
+
+        Returns:
+            cairo.TextExtents
+        """
+        key = (self._font_weight, self._font_size, text)
+        if key not in self._extents_cache:
+            self._extents_cache[key] = self._ctx.text_extents(text)
+
+        return self._extents_cache[key]
 
     def loadMonths(self) -> None:
         """Load data for each individual month from the table."""
@@ -93,14 +165,12 @@ class Canvas:
         self._table.normalizeYearlyTemperature()
 
     def createSquares(self) -> None:
-        """Create the squares and save them into the list. Each square is then rendered by itself."""
+        """Create the squares and store their coordinates. Each square is then rendered by itself."""
         if self._years_loaded == self._months_loaded:
             raise Exception("Both years and months have been loaded, or neither have.")
 
         # calculate number of rows and columns
         self._items = int(sqrt(self._years_count) + 0.5)
-        # init container list
-        self._squares = []
 
         # size of the square
         scl = min(
@@ -112,42 +182,144 @@ class Canvas:
         # last year in the temperature data
         last_year = self._table.last_year
 
-        # clear squares list
-        self._squares = []
-
-        # loop generating the square
-        for i in range(self._items * self._items):
-            # calculate current year and skip if
-            # it's bigger than the latest year
-            current_year = first_year + i
-            if current_year > last_year:
-                continue
-
-            # calculate xy coordinates of the square
-            x = i % self._items
-            y = i // self._items
-
-            # extract temperature data
-
-            if self._table.normalized_yearly_data:
-                # append the square to the list of squares
-                self._squares.append(
-                    Square(
-                        x * scl,
-                        y * scl,
-                        scl,
-                        self._table.normalized_yearly_data[current_year],
-                    )
-                )
-            else:
-                # terribly hacked together
-                self._squares.append(
-                    Square(
-                        x * scl,
-                        y * scl,
-                        scl,
-                    )
-                )
+        # number of squares, one for each year fitting in the grid
+        count = min(last_year - first_year + 1, self._items * self._items)
+        # xy coordinates of the squares, row by row
+        xs, ys = np.meshgrid(np.arange(self._items), np.arange(self._items))
+        xs = xs.ravel()[:count].tolist()
+        ys = ys.ravel()[:count].tolist()
+
+        # generate the squares
+        squares = [Square(x * scl, y * scl, scl) for x, y in zip(xs, ys)]
+
+        # store the coordinates of the squares as columns, all the squares
+        # have the same size
+        self._squares_x = np.array([s.x for s in squares])
+        self._squares_y = np.array([s.y for s in squares])
+        self._squares_scl = squares[0].scl
+        # keep the first and the last square to place the labels
+        self._first_square = squares[0]
+        self._last_square = squares[-1]
+
+        # create the labels, as the years are known
+        self._createLabels()
+        # precompute the pixel bounds and the colors of the squares
+        self._createBounds()
+        self._createColors()
+        # draw the parts of the frame that never change
+        self._createBase()
+
+    def _createColors(self) -> None:
+        """Precompute the color of each square, as the temperatures never change."""
+        first_year = self._table.first_year
+        years = range(first_year, first_year + len(self._squares_x))
+
+        if self._years_loaded:
+            # the colors of the single frame are final
+            temperatures = np.array(
+                [self._table.normalized_yearly_data[year] for year in years]
+            )
+            self._year_temperatures = temperatures
+            self._year_pixels = blend_colors(
+                get_colors(temperatures), self._background_color
+            )
+
+            # calculate the color of the temperature written on each square
+            white_threshold = 0.2
+            ch_span = 0.1
+            magnitude = np.abs(temperatures)
+            self._text_colors = np.where(
+                magnitude > white_threshold,
+                rescale(magnitude, white_threshold, 1, 1 - ch_span, 1),
+                rescale(magnitude, 0, white_threshold, 0, ch_span),
+            )
+        else:
+            # the colors of the animation are interpolated frame by frame
+            temperatures = self._table.normalized_monthly_array
+            self._frame_pixels = np.empty(len(years), dtype=np.uint32)
+            self._color_lut = create_lut(self._background_color)
+            # rescale the temperatures to the lut once, instead of every frame
+            self._month_indices = lut_indices(
+                temperatures[: len(years)], self._color_lut
+            )
+
+    def _createBase(self) -> None:
+        """Draw the background, the labels and the title once, as they are the same in every frame."""
+        # clear and scale the canvas
+        self._clearCanvas()
+        self._saveCanvas()
+        self._scaleCanvas()
+
+        # draw all the labels
+        self._drawLabels()
+
+        # restore position to write title relative to total area
+        # and not drawing area
+        self._restoreCanvas()
+
+        # draw title
+        self._drawTitle()
+
+        # store the drawn pixels
+        self._canvas.flush()
+        self._base_pixels = self._pixels.copy()
+        # the squares are yet to be drawn, the alpha channel
+        # is never zero for a drawn square
+        self._drawn_pixels = np.zeros(len(self._squares_x), dtype=np.uint32)
+
+    def _createBounds(self) -> None:
+        """Compute the bounds in pixels of each square, storing each of them in an array."""
+        # apply the same transformation used to draw the squares
+        self._saveCanvas()
+        self._scaleCanvas()
+
+        scl = self._squares_scl
+        bounds = []
+        for x, y in zip(self._squares_x.tolist(), self._squares_y.tolist()):
+            x0, y0 = self._ctx.user_to_device(x, y)
+            x1, y1 = self._ctx.user_to_device(x + scl, y + scl)
+            bounds.append((round(x0), round(y0), round(x1), round(y1)))
+
+        self._restoreCanvas()
+
+        # clip the bounds to the canvas
+        bounds = np.array(bounds, dtype=int).reshape(-1, 4)
+        self._squares_x0 = np.clip(bounds[:, 0], 0, self._width)
+        self._squares_y0 = np.clip(bounds[:, 1], 0, self._height)
+        self._squares_x1 = np.clip(bounds[:, 2], 0, self._width)
+        self._squares_y1 = np.clip(bounds[:, 3], 0, self._height)
+        # squares completely outside the canvas are never drawn
+        self._squares_visible = (self._squares_x1 > self._squares_x0) & (
+            self._squares_y1 > self._squares_y0
+        )
+
+    def _fillSquares(self, pixels: np.ndarray) -> None:
+        """Fill the squares by writing directly into the pixel buffer.
+
+        Only the squares whose pixel changed since the last time they were
+        drawn are written: as the colors are quantized, most of the squares
+        are left untouched between two consecutive frames.
+
+        Args:
+            pixels (np.ndarray): ARGB32 pixel of each square
+        """
+        changed = pixels != self._drawn_pixels
+        changed = np.flatnonzero(changed & self._squares_visible)
+        self._drawn_pixels[changed] = pixels[changed]
+
+        # bind the lookups out of the loop
+        buffer = self._pixels
+
+        self._canvas.flush()
+        for x0, y0, x1, y1, pixel in zip(
+            self._squares_x0[changed],
+            self._squares_y0[changed],
+            self._squares_x1[changed],
+            self._squares_y1[changed],
+            pixels[changed],
+        ):
+            buffer[y0:y1, x0:x1] = pixel
+        self._canvas.mark_dirty()
 
     def _drawFrame(self, percent: float) -> None:
         """Draw a frame from the whole animation.
@@ -157,97 +329,76 @@ class Canvas:
         """
         # calculate advancement in current month and
         # wrap in [0, 1) range
-        month_percent = percent * 12
-        while month_percent > 1:
-            month_percent -= 1
+        month_percent = (percent * 12) % 1
         # calculate current and next month
-        current_month = int(percent * 12)
+        current_month = int(percent * 12) % 12
         next_month = (current_month + 1) % 12
-        # load all temperature data
-        temperatures = self._table.normalized_monthly_data
-        first_year = self._table.first_year
+        # get the colors relative to current month advancement
+        pixels = compute_pixels(
+            self._month_indices,
+            current_month,
+            next_month,
+            month_percent,
+            self._color_lut,
+            self._frame_pixels,
+        )
 
         # draw squares
-        for x, s in enumerate(self._squares):
-            current_temperature = temperatures[first_year + x][current_month]
-            next_temperature = temperatures[first_year + x][next_month]
-            # get the interpolated temperature relative to current month advancement
-            interpolated = interpolate_temperature(
-                current_temperature, next_temperature, month_percent
-            )
-            # get the color relative to the interpolated temperature
-            color = get_color(interpolated)
-            # draw the square
-            self._ctx.set_source_rgba(*color)
-            self._ctx.rectangle(s.x, s.y, s.scl, s.scl)
-            self._ctx.fill()
+        self._fillSquares(pixels)
 
     def _drawSingleFrame(self) -> None:
         """Draw a single frame, composing the output."""
-        # load all temperature data
-        temperatures = self._table.normalized_yearly_data
-        first_year = self._table.first_year
-
         # preload font settings
-        self._ctx.select_font_face(
-            "Gilroy", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD
-        )
-
-        self._ctx.set_font_size(self._text_font_size)
-        self._ctx.set_antialias(cairo.ANTIALIAS_SUBPIXEL)
+        self._selectFont(cairo.FONT_WEIGHT_BOLD)
+        self._setFontSize(self._text_font_size)
 
         # draw squares
-        for x, s in enumerate(
-            self._squares,
+        self._fillSquares(self._year_pixels)
+
+        # bind the lookups out of the loop
+        text_extents = self._textExtents
+        set_source_rgba = self._ctx.set_source_rgba
+        move_to = self._ctx.move_to
+        show_text = self._ctx.show_text
+
+        # draw temperatures
+        scl = self._squares_scl
+        for x, y, t, ch in zip(
+            self._squares_x.tolist(),
+            self._squares_y.tolist(),
+            self._year_temperatures.tolist(),
+            self._text_colors.tolist(),
         ):
-            # get the color relative to the interpolated temperature
-            color = get_color(temperatures[first_year + x])
-
             # create the text
-            prefix = "+" if s.temperature > 0 else ""
-            temperature = f"{prefix}{s.temperature:.2f} °C"
+            prefix = "+" if t > 0 else ""
+            temperature = f"{prefix}{t:.2f} °C"
 
             # calculate text sizes
-            tw = self._ctx.text_extents(temperature).width
-            th = self._ctx.text_extents(temperature).height
-            dx = (s.scl - tw) / 2
-            dy = (s.scl + th) / 2
-
-            # calculate text color
-            white_threshold = 0.2
-            ch_span = 0.1
-            if abs(s.temperature) > white_threshold:
-                ch = rescale(abs(s.temperature), white_threshold, 1, 1 - ch_span, 1)
-            else:
-                ch = rescale(abs(s.temperature), 0, white_threshold, 0, ch_span)
-
-            # draw the square
-            self._ctx.set_source_rgba(*color)
-            self._ctx.rectangle(s.x, s.y, s.scl, s.scl)
-            self._ctx.fill()
+            extents = text_extents(temperature)
+            tw, th = extents.width, extents.height
+            dx = (scl - tw) / 2
+            dy = (scl + th) / 2
 
             # draw the text
-            self._ctx.set_source_rgba(ch, ch, ch, 1)
-            self._ctx.move_to(s.x + dx, s.y + dy)
-            self._ctx.show_text(temperature)
+            set_source_rgba(ch, ch, ch, 1)
+            move_to(x + dx, y + dy)
+            show_text(temperature)
 
     def _drawLabels(self) -> None:
         """Draw all the labels in the frame."""
         # calculate text position
-        tx = self._squares[-1].x + self._squares[-1].scl * 1.1
-        ty = self._squares[-1].y
+        tx = self._last_square.x + self._last_square.scl * 1.1
+        ty = self._last_square.y
 
         # set font
-        self._ctx.select_font_face(
-            "Gilroy", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD
-        )
+        self._selectFont(cairo.FONT_WEIGHT_BOLD)
         # set text color
-        self._ctx.set_source_rgb(*self._text_color)
+        self._ctx.set_source(self._text_source)
         # set text size
-        self._ctx.set_font_size(self._subtitle_font_size)
+        self._setFontSize(self._subtitle_font_size)
 
         # getline height
-        text_height = self._ctx.text_extents(self._labels[0]).height
+        text_height = self._textExtents(self._labels[0]).height
 
         # write text lines at the end
         for i, line in enumerate(self._labels[:3]):
@@ -255,53 +406,44 @@ class Canvas:
             self._ctx.show_text(line)
 
         # draw first year label
-        self._ctx.select_font_face(
-            "Gilroy", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL
-        )
-        self._ctx.set_source_rgb(*self._text_color)
+        self._selectFont(cairo.FONT_WEIGHT_NORMAL)
+        self._ctx.set_source(self._text_source)
 
         # draw first year label
-        scl = self._squares[-1].scl
-        tx, ty = self._squares[0].position
-        height = self._ctx.text_extents(self._labels[4]).height
+        scl = self._last_square.scl
+        tx, ty = self._first_square.position
+        height = self._textExtents(self._labels[4]).height
         self._ctx.move_to(tx, ty - height)
         self._ctx.show_text(self._labels[3])
 
         # draw last year label
-        tx, ty = self._squares[-1].position
-        width = self._ctx.text_extents(self._labels[4]).width
+        tx, ty = self._last_square.position
+        width = self._textExtents(self._labels[4]).width
         self._ctx.move_to(tx + scl - width, ty + scl + self._subtitle_font_size * 1.3)
         self._ctx.show_text(self._labels[4])
 
     def _drawTitle(self) -> None:
         """Draw the title and the subtitle of the frame."""
-        self._title = "average Earth temperature, year by year"
-        self._subtitle = "the temperature anomalies are evaluated with respect to the mean of all records"
-
         # get size of the last square
-        scl = self._squares[-1].scl
+        scl = self._last_square.scl
 
         # calculate text position
         tx = self._width * self._border / 2
         ty = scl * 0.75
 
         # set text color
-        self._ctx.set_source_rgba(*self._title_color)
-        self._ctx.select_font_face(
-            "Gilroy", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD
-        )
+        self._ctx.set_source(self._title_source)
+        self._selectFont(cairo.FONT_WEIGHT_BOLD)
 
         # write title
-        self._ctx.set_font_size(self._title_font_size)
+        self._setFontSize(self._title_font_size)
         self._ctx.move_to(tx + self._title_font_size / 4, ty)
         self._ctx.show_text(self._title)
 
-        self._ctx.select_font_face(
-            "Gilroy", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL
-        )
+        self._selectFont(cairo.FONT_WEIGHT_NORMAL)
         # write sub title
-        subtitle_height = self._ctx.text_extents(self._subtitle).height
-        self._ctx.set_font_size(self._subtitle_font_size)
+        subtitle_height = self._textExtents(self._subtitle).height
+        self._setFontSize(self._subtitle_font_size)
 
         self._ctx.move_to(
             tx + self._title_font_size / 2,
@@ -321,9 +463,17 @@ class Canvas:
             duration (int, optional): duration of the whole animation. Defaults to 0.
             write_temperatures (bool, optional): whether to write the temperatures. Defaults to False.
         """
-        # save and clear the canvas
+        if not self._months_loaded:
+            # restore the background, the labels and the title, clearing
+            # the temperatures written over the squares
+            self._canvas.flush()
+            np.copyto(self._pixels, self._base_pixels)
+            self._canvas.mark_dirty()
+            self._drawn_pixels[:] = 0
+
+        # save and scale the canvas
         self._saveCanvas()
-        self._clearCanvas()
+        self._scaleCanvas()
 
         if self._months_loaded:
             # calculate current percent
@@ -334,21 +484,54 @@ class Canvas:
             # draw the frame for the whole dataset
             self._drawSingleFrame()
 
-        # draw all the labels
-        self._createLabels()
-        self._drawLabels()
-
-        # restore position to write title relative to total area
-        # and not drawing area
+        # restore the canvas status
         self._restoreCanvas()
 
-        # draw title
-        self._drawTitle()
+    def toBytes(self) -> bytes:
+        """Return the raw pixels of the drawing.
+
+        Each pixel is a native endian 32 bit ARGB integer, row by row.
+
+        Returns:
+            bytes
+        """
+        self._canvas.flush()
+        return self._pixels.tobytes()
 
     def save(self, path: str = "output.png") -> None:
         """Save drawing to file.
 
+        Paths ending in ".bmp" are written as uncompressed BMP,
+        everything else as PNG.
+
+        Args:
+            path (str, optional): Path of the image. Defaults to "output.png".
+        """
+        self._canvas.flush()
+        if path.endswith(".bmp"):
+            # no compression, the pixels are written as they are
+            write_bmp(self._pixels, path)
+        else:
+            self._canvas.write_to_png(path)
+
+    def saveInBackground(self, path: str = "output.png") -> Future:
+        """Save drawing to file in background, like save.
+
+        The drawing is copied first, so the canvas can be drawn again
+        while the image is being encoded and written.
+
         Args:
             path (str, optional): Path of the image. Defaults to "output.png".
+
+        Returns:
+            Future: completed when the image has been written
         """
-        self._canvas.write_to_png(path)
+        self._canvas.flush()
+        pixels = self._pixels.copy()
+        if path.endswith(".bmp"):
+            return self._save_pool.submit(write_bmp, pixels, path)
+
+        surface = cairo.ImageSurface.create_for_data(
+            pixels, cairo.FORMAT_ARGB32, self._width, self._height
+        )
+        return self._save_pool.submit(surface.write_to_png, path)
@@ -1,9 +1,40 @@
 """File containing all the logic needed to create the animation."""
 
 import argparse
+import subprocess
+import sys
+
+from functools import partial
+from multiprocessing import Pool
 
 from canvas import Canvas
 
+# canvas used by each worker process to render the frames
+_canvas = None
+
+
+def positive_int(value: str) -> int:
+    """Parse a strictly positive integer from the command line.
+
+    Args:
+        value (str): value passed to the argument
+
+    Raises:
+        argparse.ArgumentTypeError: if the value is not an integer above zero
+
+    Returns:
+        int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+
+    return number
+
 
 def parse_args() -> argparse.Namespace:
     """Parse arguments from the command line.
@@ -47,6 +78,36 @@ def parse_args() -> argparse.Namespace:
         help="Generate a static image of the average temperature for all years",
         action="store_true",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        help="number of processes rendering the frames (defaults to the number of CPUs)",
+        default=None,
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["png", "bmp"],
+        help="file format of the frames, bmp is faster to write but larger "
+        "(defaults to png)",
+        default="png",
+    )
+    parser.add_argument(
+        "-v",
+        "--video",
+        type=str,
+        help="pipe the frames straight to ffmpeg and save the video to this path, "
+        "instead of saving each frame (rendered in a single process)",
+        default=None,
+    )
+    parser.add_argument(
+        "-r",
+        "--fps",
+        type=int,
+        help="frame rate of the video (defaults to 30)",
+        default=30,
+    )
     parser.add_argument(
         "--debug", help="debug by saving the first frame only", action="store_true"
     )
@@ -54,36 +115,241 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def init_worker(size: int, title_size: int, border: float) -> None:
+    """Create the canvas used by the current process to render the frames.
+
+    Args:
+        size (int): Size of the drawing area
+        title_size (int): Height of the title
+        border (float): Border of the drawing area
+    """
+    global _canvas
+    _canvas = Canvas(size, title_size, border)
+    _canvas.loadMonths()
+    _canvas.createSquares()
+
+
+def frame_path(frame: int, extension: str = "png") -> str:
+    """Path of a frame of the animation.
+
+    Args:
+        frame (int): frame of the animation
+        extension (str, optional): file format of the frame. Defaults to "png".
+
+    Returns:
+        str
+    """
+    return f"output/frames/{str(frame).zfill(7)}.{extension}"
+
+
+def render_frame(frame: int, duration: int, extension: str = "png") -> str:
+    """Render a frame of the animation and save it to file.
+
+    The canvas must have been created by init_worker in the current process.
+
+    Args:
+        frame (int): current frame being rendered
+        duration (int): duration of the whole animation
+        extension (str, optional): file format of the frame. Defaults to "png".
+
+    Returns:
+        str: path of the saved frame
+    """
+    filename = frame_path(frame, extension)
+    _canvas.draw(frame, duration)
+    _canvas.save(filename)
+    return filename
+
+
+def render_frames(
+    frames: range,
+    duration: int,
+    size: int,
+    title_size: int,
+    border: float,
+    jobs: int,
+    extension: str = "png",
+) -> None:
+    """Render the frames of the animation in parallel, one process per job.
+
+    With a single job, the frames are rendered in the current process and
+    each frame is written to file while the next one is drawn.
+
+    Args:
+        frames (range): frames to be rendered
+        duration (int): duration of the whole animation
+        size (int): Size of the drawing area
+        title_size (int): Height of the title
+        border (float): Border of the drawing area
+        jobs (int): number of processes. If None, the number of CPUs is used.
+        extension (str, optional): file format of the frames. Defaults to "png".
+    """
+    if jobs == 1:
+        init_worker(size, title_size, border)
+        saving = None
+        for count, frame in enumerate(frames, 1):
+            _canvas.draw(frame, duration)
+            # wait for the previous frame, so that at most
+            # one frame is being written while drawing
+            if saving is not None:
+                saving.result()
+            saving = _canvas.saveInBackground(frame_path(frame, extension))
+            print(f"Generated frame {count}/{len(frames)}")
+
+        if saving is not None:
+            saving.result()
+        return
+
+    with Pool(
+        jobs, initializer=init_worker, initargs=(size, title_size, border)
+    ) as pool:
+        # frames are sent to the workers in small batches to cut down the
+        # messages between processes, and reported as soon as they are saved
+        rendered = pool.imap_unordered(
+            partial(render_frame, duration=duration, extension=extension),
+            frames,
+            chunksize=8,
+        )
+        for count, _ in enumerate(rendered, 1):
+            print(f"Generated frame {count}/{len(frames)}")
+
+
+def render_raw_frame(frame: int, duration: int) -> bytes:
+    """Render a frame of the animation and return its raw pixels.
+
+    The canvas must have been created by init_worker in the current process.
+
+    Args:
+        frame (int): current frame being rendered
+        duration (int): duration of the whole animation
+
+    Returns:
+        bytes: native endian ARGB32 pixels
+    """
+    _canvas.draw(frame, duration)
+    return _canvas.toBytes()
+
+
+def render_video(
+    path: str,
+    fps: int,
+    frames: range,
+    duration: int,
+    size: int,
+    title_size: int,
+    border: float,
+) -> None:
+    """Render the frames of the animation and pipe them to ffmpeg.
+
+    The frames are encoded as they are rendered, without writing them to file.
+    They are rendered in the current process: ffmpeg encodes slower than the
+    frames are drawn, so writing to its input keeps the drawing in step with
+    the encoding and no frames pile up in memory.
+
+    Args:
+        path (str): path of the video
+        fps (int): frame rate of the video
+        frames (range): frames to be rendered
+        duration (int): duration of the whole animation
+        size (int): Size of the drawing area
+        title_size (int): Height of the title
+        border (float): Border of the drawing area
+    """
+    # the canvas is a square, including the title
+    side = size + title_size
+    # native endian ARGB32 pixels, as stored by cairo
+    pixel_format = "bgra" if sys.byteorder == "little" else "argb"
+    command = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        pixel_format,
+        "-s",
+        f"{side}x{side}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-pix_fmt",
+        "yuv420p",
+        path,
+    ]
+
+    try:
+        # unbuffered, so that a closed pipe is noticed on the first write
+        ffmpeg = subprocess.Popen(command, stdin=subprocess.PIPE, bufsize=0)
+    except FileNotFoundError:
+        sys.exit("ffmpeg not found, --video requires it")
+
+    closed_early = False
+    with ffmpeg:
+        try:
+            init_worker(size, title_size, border)
+            for count, frame in enumerate(frames, 1):
+                ffmpeg.stdin.write(render_raw_frame(frame, duration))
+                print(f"Encoded frame {count}/{len(frames)}")
+
+            ffmpeg.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg quit before reading every frame
+            closed_early = True
+
+    if closed_early:
+        sys.exit(
+            f"ffmpeg stopped reading frames (exit status {ffmpeg.returncode}), "
+            f"{path} is incomplete"
+        )
+    if ffmpeg.returncode != 0:
+        sys.exit(f"ffmpeg failed with exit status {ffmpeg.returncode}")
+
+
 def main() -> None:
     """Render the animation according to the arguments."""
     args = parse_args()
-    # create a canvas
-    canvas = Canvas(args.size, args.title_size, args.border)
 
-    # load data according to the args
     if args.static:
+        # create a canvas
+        canvas = Canvas(args.size, args.title_size, args.border)
+        # load data and init the squares
         canvas.loadYears()
-    else:
-        canvas.loadMonths()
+        canvas.createSquares()
 
-    # init the squares
-    canvas.createSquares()
-
-    if args.static:
         filename = "output/all.png"
         print("Generating one frame")
         canvas.draw()
         canvas.save(filename)
+    elif args.video:
+        # encode the frames as they are drawn, only the first one if debugging
+        frames = range(1) if args.debug else range(args.duration)
+        print(f"Encoding {len(frames)} frames")
+        render_video(
+            args.video,
+            args.fps,
+            frames,
+            args.duration,
+            args.size,
+            args.title_size,
+            args.border,
+        )
+    elif args.debug:
+        # draw only the first frame
+        print(f"Generating frame 1/{args.duration}")
+        init_worker(args.size, args.title_size, args.border)
+        render_frame(0, args.duration, args.format)
     else:
         # draw each frame separately
-        for frame in range(args.duration):
-            filename = f"output/frames/{str(frame).zfill(7)}.png"
-            print(f"Generating frame {frame + 1}/{args.duration}")
-            canvas.draw(frame, args.duration)
-            canvas.save(filename)
-
-            if args.debug:
-                break
+        print(f"Generating {args.duration} frames")
+        render_frames(
+            range(args.duration),
+            args.duration,
+            args.size,
+            args.title_size,
+            args.border,
+            args.jobs,
+            args.format,
+        )
 
 
 if __name__ == "__main__":
@@ -1,29 +1,39 @@
 """File containing the class handling a square. This is not more complicated than a dataclass."""
 
 
-from pydoc import tempfilepager
-
-
 class Square:
     """Class containing a square."""
 
-    def __init__(self, x: int, y: int, scl: int, temperature: float = 0) -> None:
+    __slots__ = (
+        "_x",
+        "_y",
+        "_scl",
+        "_border",
+        "_inner_x",
+        "_inner_y",
+        "_inner_scl",
+    )
+
+    def __init__(self, x: int, y: int, scl: int) -> None:
         """Create the square.
 
         Args:
             x (int): Top left x coordinate of the square
             y (int): Top left y coordinate of the square
             scl (int): Size of the square
-            temperature (int): Temperature relative to square
         """
         self._x = x
         self._y = y
         self._scl = scl
-        self._temperature = temperature
 
         # hard coded, there's no need to toggle this
         self._border = 0.1
 
+        # the square is drawn inside its border, the bounds never change
+        self._inner_x = self._x + self._border / 2 * self._scl
+        self._inner_y = self._y + self._border / 2 * self._scl
+        self._inner_scl = self._scl * (1 - self._border)
+
     @property
     def x(self) -> float:
         """Top left corner x coordinate of the square.
@@ -31,7 +41,7 @@ class Square:
         Returns:
             float
         """
-        return self._x + self._border / 2 * self._scl
+        return self._inner_x
 
     @property
     def y(self) -> float:
@@ -40,7 +50,7 @@ class Square:
         Returns:
             float
         """
-        return self._y + self._border / 2 * self._scl
+        return self._inner_y
 
     @property
     def position(self) -> tuple[float, float]:
@@ -49,7 +59,7 @@ class Square:
         Returns:
             tuple[float, float]: x and y coordinates
         """
-        return (self.x, self.y)
+        return (self._inner_x, self._inner_y)
 
     @property
     def scl(self) -> float:
@@ -58,13 +68,4 @@ class Square:
         Returns:
             float
         """
-        return self._scl * (1 - self._border)
-
-    @property
-    def temperature(self) -> float:
-        """Temperature of the square.
-
-        Returns:
-            float
-        """
-        return self._temperature
+        return self._inner_scl
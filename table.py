@@ -1,9 +1,8 @@
 """File handling the data parsing and manipulation."""
 
-import csv
+import numpy as np
 
-from utils import rescale
-from datetime import date
+from utils import rescaler
 
 
 class Table:
@@ -15,11 +14,12 @@ class Table:
         Args:
             path (str): Path to the table
         """
-        self._current_year = date.today().year
         self._path = path
-        self._rows = []
+        self._years = np.empty(0, dtype=int)
+        self._temperatures = np.empty(0, dtype=float)
         self._monthly_data = {}
         self._normalized_monthly_data = {}
+        self._normalized_monthly_array = np.empty((0, 12), dtype=np.float32)
         self._normalized_yearly_data = {}
         self._yearly_data = {}
         self._monthly_data = {}
@@ -34,70 +34,76 @@ class Table:
         Returns:
             int: Number of loaded rows
         """
-        with open(self._path, "r") as f:
-            reader = csv.reader(f)
+        # each row holds the date as YYYYMM and the temperature anomaly
+        rows = np.loadtxt(
+            self._path, delimiter=",", skiprows=int(discard_header), ndmin=2
+        )
+        self._years = rows[:, 0].astype(int) // 100
+        self._temperatures = rows[:, 1]
 
-            if discard_header:
-                self._rows = list(reader)[1:]
-            else:
-                self._rows = list(reader)
+        return len(self._years)
 
-        return len(self._rows)
-
-    def _groupByMonth(self, discard_current: bool = True) -> int:
-        """Group temperatures by month for each year.
+    def _groupRows(self, discard_incomplete: bool) -> tuple:
+        """Sort the temperatures by year and find where each year starts.
 
         Args:
-            discard_current (bool, optional): Discard current year, as data
-            might be incomplete. Defaults to True.
+            discard_incomplete (bool): Mark years without data for all the
+            months as not to be kept.
 
         Returns:
-            int: Number of loaded years
+            tuple: sorted temperatures, years, index of the first temperature
+            of each year and mask of the years to keep
         """
-        self._monthly_data = {}
+        order = np.argsort(self._years, kind="stable")
+        temperatures = self._temperatures[order]
+        years, starts, counts = np.unique(
+            self._years[order], return_index=True, return_counts=True
+        )
 
-        for row in self._rows:
-            year = int(row[0][:-2])
+        if discard_incomplete:
+            keep = counts == 12
+        else:
+            keep = np.ones(len(years), dtype=bool)
 
-            if discard_current and year == self._current_year:
-                continue
+        return temperatures, years, starts, keep
 
-            temperature = float(row[1])
+    def _groupByMonth(self, discard_incomplete: bool = True) -> int:
+        """Group temperatures by month for each year.
 
-            if year not in self._monthly_data:
-                self._monthly_data[year] = []
+        Args:
+            discard_incomplete (bool, optional): Discard years without data
+            for all the months, like the current one. Defaults to True.
 
-            self._monthly_data[year].append(temperature)
+        Returns:
+            int: Number of loaded years
+        """
+        temperatures, years, starts, keep = self._groupRows(discard_incomplete)
+
+        self._monthly_data = {
+            year: months.tolist()
+            for year, months, k in zip(
+                years.tolist(), np.split(temperatures, starts[1:]), keep
+            )
+            if k
+        }
 
         return len(self._monthly_data)
 
-    def _groupByYear(self, discard_current: bool = True) -> int:
+    def _groupByYear(self, discard_incomplete: bool = True) -> int:
         """Group temperatures by year.
 
         Args:
-            discard_current (bool, optional): Discard current year, as data
-            might be incomplete. Defaults to True.
+            discard_incomplete (bool, optional): Discard years without data
+            for all the months, like the current one. Defaults to True.
 
         Returns:
             int: Number of loaded years
         """
-        self._yearly_data = {}
-
-        for row in self._rows:
-            year = int(row[0][:-2])
-
-            if discard_current and year == self._current_year:
-                continue
-
-            temperature = float(row[1])
+        temperatures, years, starts, keep = self._groupRows(discard_incomplete)
 
-            if year not in self._yearly_data:
-                self._yearly_data[year] = 0
-
-            self._yearly_data[year] += temperature
-
-        for year in self._yearly_data:
-            self._yearly_data[year] /= 12
+        # sum the temperatures of each year and average them over 12 months
+        averages = np.add.reduceat(temperatures, starts) / 12
+        self._yearly_data = dict(zip(years[keep].tolist(), averages[keep].tolist()))
 
         return len(self._yearly_data)
 
@@ -123,19 +129,39 @@ class Table:
 
         return 0
 
+    def _normalize(
+        self, values: np.ndarray, min_value: float, max_value: float
+    ) -> np.ndarray:
+        """Map values from range [min_value, max_value] to range [-1, 1].
+
+        Args:
+            values (np.ndarray): Values to be mapped
+            min_value (float)
+            max_value (float)
+
+        Returns:
+            np.ndarray
+        """
+        return rescaler(min_value, max_value, -1, 1)(values)
+
     def normalizeMonthlyTemperature(self) -> int:
         """Normalize temperature anomalies in range [-1, 1].
 
         Returns:
             int: Number of years
         """
-        max_temp = max(float(r[1]) for r in self._rows)
-        min_temp = min(float(r[1]) for r in self._rows)
+        # the range is taken on every row, including the discarded ones
+        max_temp = self._temperatures.max()
+        min_temp = self._temperatures.min()
 
-        for year, temperatures in self._monthly_data.items():
-            self._normalized_monthly_data[year] = [
-                rescale(t, min_temp, max_temp, -1, 1) for t in temperatures
-            ]
+        # rescale every year at once, one row for each year
+        temperatures = np.array(list(self._monthly_data.values()), dtype=float)
+        normalized = self._normalize(temperatures.reshape(-1, 12), min_temp, max_temp)
+
+        self._normalized_monthly_data = dict(
+            zip(self._monthly_data.keys(), normalized.tolist())
+        )
+        self._normalized_monthly_array = normalized.astype(np.float32)
 
         return len(self._normalized_monthly_data)
 
@@ -145,13 +171,14 @@ class Table:
         Returns:
             int: Number of years
         """
-        max_temp = max(self._yearly_data.values())
-        min_temp = min(self._yearly_data.values())
+        temperatures = np.fromiter(self._yearly_data.values(), dtype=float)
+        normalized = self._normalize(
+            temperatures, temperatures.min(), temperatures.max()
+        )
 
-        for year, temperature in self._yearly_data.items():
-            self._normalized_yearly_data[year] = rescale(
-                temperature, min_temp, max_temp, -1, 1
-            )
+        self._normalized_yearly_data = dict(
+            zip(self._yearly_data.keys(), normalized.tolist())
+        )
 
         return len(self._normalized_yearly_data)
 
@@ -173,6 +200,15 @@ class Table:
         """
         return self._normalized_monthly_data
 
+    @property
+    def normalized_monthly_array(self) -> np.ndarray:
+        """Return normalized monthly data as an array with a row for each year.
+
+        Returns:
+            np.ndarray
+        """
+        return self._normalized_monthly_array
+
     @property
     def yearly_data(self) -> dict[int, float]:
         """Return yearly data for each year.
@@ -1,24 +1,62 @@
 """File containing a bunch of functions used in the whole project."""
 
+import struct
+
+from typing import Callable, Union
+
+import numpy as np
+
+# color blending constants
+COLOR_BLEND = 0.85
+ALPHA_BLEND = 0.9
+
 
 def rescale(
-    value: float, old_min: float, old_max: float, new_min: float, new_max: float
-) -> float:
+    value: Union[float, np.ndarray],
+    old_min: float,
+    old_max: float,
+    new_min: float,
+    new_max: float,
+) -> Union[float, np.ndarray]:
     """Map value to a new range.
 
+    Works on single values as well as on whole arrays at once.
+
     Args:
-        value (float): Value to be mapped
+        value (float | np.ndarray): Value to be mapped
         old_min (float)
         old_max (float)
         new_min (float)
         new_max (float)
 
     Returns:
-        float:
+        float | np.ndarray:
     """
     return (value - old_min) * (new_max - new_min) / (old_max - old_min) + new_min
 
 
+def rescaler(
+    old_min: float, old_max: float, new_min: float, new_max: float
+) -> Callable[[Union[float, np.ndarray]], Union[float, np.ndarray]]:
+    """Create a function mapping values to a new range, like rescale.
+
+    The constants of the mapping are computed only once, so each call
+    is reduced to a multiplication and an addition.
+
+    Args:
+        old_min (float)
+        old_max (float)
+        new_min (float)
+        new_max (float)
+
+    Returns:
+        Callable[[Union[float, np.ndarray]], float | np.ndarray]
+    """
+    scale = (new_max - new_min) / (old_max - old_min)
+    offset = new_min - old_min * scale
+    return lambda value: value * scale + offset
+
+
 def poly_smooth(x: float, n: float = 3) -> float:
     """Polynomial easing of a variable in range [0, 1].
 
@@ -29,51 +67,139 @@ def poly_smooth(x: float, n: float = 3) -> float:
     Returns:
         float: _description_
     """
-    if x > 1:
-        return 1
-    if x < 0:
-        return 0
+    # clamp the variable, so that the result is always a float
+    x = min(1.0, max(0.0, x))
 
     if x < 0.5:
-        return pow(2, n - 1) * pow(x, n)
+        return 2 ** (n - 1) * x**n
 
-    return 1 - pow(-2 * x + 2, n) / 2
+    return 1 - (-2 * x + 2) ** n / 2
 
 
-def get_color(temperature: float) -> tuple[float, float, float, float]:
-    """Get color from temperature.
+def get_colors(temperatures: np.ndarray) -> np.ndarray:
+    """Get colors from an array of temperatures.
 
     Args:
-        temperature (float): Temperature in range [-1, 1]
+        temperatures (np.ndarray): Temperatures in range [-1, 1]
     Return
-        tuple: RGBA tuple
+        np.ndarray: RGBA colors, one row for each temperature
+    """
+    negative = temperatures < 0
+    magnitude = np.abs(temperatures)
+    channel = magnitude * COLOR_BLEND + (1 - COLOR_BLEND)
+
+    colors = np.zeros((*temperatures.shape, 4))
+    # blue if temperature < 0, red otherwise
+    colors[..., 0] = np.where(negative, 0, channel)
+    colors[..., 2] = np.where(negative, channel, 0)
+    colors[..., 3] = magnitude * ALPHA_BLEND + (1 - ALPHA_BLEND)
+    return colors
+
+
+def blend_colors(
+    colors: np.ndarray, background: tuple[float, float, float]
+) -> np.ndarray:
+    """Blend colors over an opaque background.
+
+    Args:
+        colors (np.ndarray): RGBA colors, one for each row
+        background (tuple[float, float, float]): RGB background color
+
+    Returns:
+        np.ndarray: opaque pixels, one for each row
+    """
+    alpha = colors[..., 3:]
+    blended = colors[..., :3] * alpha + np.asarray(background) * (1 - alpha)
+    channels = np.round(blended * 255).astype(np.uint32)
+
+    # pack the channels as ARGB32 pixels
+    return (
+        np.uint32(0xFF000000)
+        | channels[..., 0] << 16
+        | channels[..., 1] << 8
+        | channels[..., 2]
+    )
+
+
+def create_lut(background: tuple[float, float, float], size: int = 1024) -> np.ndarray:
+    """Precompute the pixels of evenly spaced temperatures in range [-1, 1].
+
+    Args:
+        background (tuple[float, float, float]): RGB background color
+        size (int, optional): Number of temperatures. Defaults to 1024.
+
+    Returns:
+        np.ndarray: opaque pixels, one for each temperature
     """
-    # blending constant
-    color_blend = 0.85
-    alpha_blend = 0.9
+    return blend_colors(get_colors(np.linspace(-1, 1, size)), background)
 
-    # if temperature < 0, the color is blue
-    if temperature < 0:
-        channel = -temperature * color_blend + (1 - color_blend)
-        alpha = -temperature * alpha_blend + (1 - alpha_blend)
-        return (0, 0, channel, alpha)
 
-    # otherwise, the color is red
-    channel = temperature * color_blend + (1 - color_blend)
-    alpha = temperature * alpha_blend + (1 - alpha_blend)
-    return (channel, 0, 0, alpha)
+def lut_indices(temperatures: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Map temperatures in range [-1, 1] to the (fractional) indices of a lut.
+
+    Args:
+        temperatures (np.ndarray): Temperatures in range [-1, 1]
+        lut (np.ndarray): pixels of the temperatures, as returned by create_lut
+
+    Returns:
+        np.ndarray: indices of the temperatures, same shape and type
+    """
+    half = (len(lut) - 1) / 2
+    return temperatures * half + half
 
 
-def interpolate_temperature(current_t: float, next_t: float, percent: float) -> float:
-    """Interpolate temperature according to the relative percent.
+def compute_pixels(
+    indices: np.ndarray,
+    current_month: int,
+    next_month: int,
+    percent: float,
+    lut: np.ndarray,
+    out: np.ndarray,
+) -> np.ndarray:
+    """Compute the pixels of all the squares in a frame of the animation.
 
     Args:
-        current_t (float): current month temperature
-        next_t (float): next month temperature
-        percent (float): current evaluation percent
+        indices (np.ndarray): Temperatures as returned by lut_indices, one row
+        for each year and one column for each month
+        current_month (int): current month
+        next_month (int): next month
+        percent (float): advancement in current month
+        lut (np.ndarray): pixels of the temperatures, as returned by create_lut
+        out (np.ndarray): Buffer the pixels are written into, one row for each year
 
     Returns:
-        float
+        np.ndarray: opaque pixels, one for each year
     """
+    # the temperatures are already rescaled to the lut, so interpolating
+    # between the two months gives the index directly
     smooth_percent = poly_smooth(percent)
-    return (1 - smooth_percent) * current_t + smooth_percent * next_t
+    interpolated = indices[:, current_month] * (1 - smooth_percent)
+    interpolated += indices[:, next_month] * smooth_percent
+
+    # look up the pixel of the nearest temperature
+    np.rint(interpolated, out=interpolated)
+    return np.take(lut, interpolated.astype(np.intp), out=out, mode="clip")
+
+
+def write_bmp(pixels: np.ndarray, path: str) -> None:
+    """Write ARGB32 pixels to an uncompressed 32 bit BMP file.
+
+    Args:
+        pixels (np.ndarray): pixels of the image, one row for each line
+        path (str): Path of the image
+    """
+    height, width = pixels.shape
+    # little endian ARGB32 pixels are stored as BGRA bytes, as BMP expects
+    data = pixels.astype("<u4", copy=False).tobytes()
+    offset = 14 + 40
+
+    with open(path, "wb") as f:
+        # file header
+        f.write(struct.pack("<2sIHHI", b"BM", offset + len(data), 0, 0, offset))
+        # info header, the negative height stores the lines top to bottom
+        f.write(
+            struct.pack(
+                "<IiiHHIIiiII", 40, width, -height, 1, 32, 0, len(data), 0, 0, 0, 0
+            )
+        )
+        f.write(data)